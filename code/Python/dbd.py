@@ -2,10 +2,14 @@
 
 from modgrammar import *
 from itertools import chain
+import hashlib
+import multiprocessing
 import os
+import pickle
+import sys
 import codecs
 
-# parses a given dbd (as string) and returns an object with
+# parses a given dbd (as string) and returns a plain-data object with
 #
 # .columns[]
 #     .type: string
@@ -32,8 +36,87 @@ import codecs
 #         .comment: string
 
 
+class foreign_identifier_raw:
+    __slots__ = ("table", "column")
+
+    def __init__(self, table, column):
+        self.table = table
+        self.column = column
+
+    def __str__(self):
+        return "{}::{}".format(self.table, self.column)
+
+
+class column_definition_raw:
+    __slots__ = ("type", "name", "is_confirmed_name", "foreign", "comment")
+
+    def __init__(self, type, name, is_confirmed_name, foreign, comment):
+        self.type = type
+        self.name = name
+        self.is_confirmed_name = is_confirmed_name
+        self.foreign = foreign
+        self.comment = comment
+
+
+class definition_entry_raw:
+    __slots__ = ("column", "int_width", "is_unsigned", "array_size", "annotation", "comment")
+
+    def __init__(self, column, int_width, is_unsigned, array_size, annotation, comment):
+        self.column = column
+        self.int_width = int_width
+        self.is_unsigned = is_unsigned
+        self.array_size = array_size
+        self.annotation = annotation
+        self.comment = comment
+
+
+class definitions_raw:
+    __slots__ = ("builds", "layouts", "comments", "entries")
+
+    def __init__(self, builds, layouts, comments, entries):
+        self.builds = builds
+        self.layouts = layouts
+        self.comments = comments
+        self.entries = entries
+
+
+class dbd_file_raw:
+    __slots__ = ("columns", "definitions")
+
+    def __init__(self, columns, definitions):
+        self.columns = columns
+        self.definitions = definitions
+
+
+def _raw_column(column):
+    foreign = foreign_identifier_raw(sys.intern(str(column.foreign.table)),
+                                     sys.intern(str(column.foreign.column))) \
+        if column.foreign else None
+    return column_definition_raw(sys.intern(column.type), sys.intern(column.name),
+                                 column.is_confirmed_name, foreign, column.comment)
+
+
+def _raw_definition(definition):
+    builds = [build if isinstance(build, tuple)
+              else build_version_raw(build.major, build.minor, build.patch, build.build)
+              for build in definition.builds]
+    entries = [definition_entry_raw(sys.intern(entry.column), entry.int_width, entry.is_unsigned,
+                                    entry.array_size, [sys.intern(a) for a in entry.annotation],
+                                    entry.comment)
+               for entry in definition.entries]
+    return definitions_raw(builds, definition.layouts, definition.comments, entries)
+
+
+# the parse tree references the grammar classes and cannot be pickled, so
+# reduce it to the plain-data objects above (which can cross process
+# boundaries) before handing it back
+def raw_dbd_file(parsed):
+    return dbd_file_raw([_raw_column(column) for column in parsed.columns],
+                        [_raw_definition(definition) for definition in parsed.definitions])
+
+
 def parse_dbd(content):
-    return dbd_parser.parse_string(content)
+    return raw_dbd_file(dbd_parser.parse_string(content))
 
 
 def parse_dbd_file(path):
@@ -47,11 +130,56 @@ def parse_dbd_file(path):
 file_suffix = ".dbd"
 
 
+def _dbd_files(path):
+    return sorted(file for file in os.listdir(path) if file.endswith(file_suffix))
+
+
+def _parse_files(path, files):
+    paths = [os.path.join(path, file) for file in files]
+    if len(paths) > 1:
+        with multiprocessing.Pool() as pool:
+            parsed = pool.map(parse_dbd_file, paths, chunksize=8)
+    else:
+        parsed = [parse_dbd_file(path) for path in paths]
+    strip = len(file_suffix)
+    return {file[:-strip]: data for file, data in zip(files, parsed)}
+
+
 def parse_dbd_directory(path):
-    dbds = {}
-    for file in os.listdir(path):
-        if file.endswith(file_suffix):
-            dbds[file[:-len(file_suffix)]] = parse_dbd_file(os.path.join(path,file))
+    return _parse_files(path, _dbd_files(path))
+
+
+cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "wowdbdefs")
+
+
+def _directory_state(path, files):
+    mtime = 0
+    for file in files:
+        mtime = max(mtime, os.stat(os.path.join(path, file)).st_mtime_ns)
+    return (tuple(files), mtime)
+
+
+# like parse_dbd_directory, but keeps a pickled copy of the result keyed on
+# the directory contents, so repeated runs skip the parse entirely
+def parse_dbd_directory_cached(path):
+    cache = os.path.join(cache_dir,
+                         "dbds_{}.pkl".format(hashlib.sha1(os.path.abspath(path).encode()).hexdigest()))
+    files = _dbd_files(path)
+    state = _directory_state(path, files)
+    try:
+        with open(cache, "rb") as f:
+            cached_state, dbds = pickle.load(f)
+        if cached_state == state:
+            return dbds
+    except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        pass
+    dbds = _parse_files(path, files)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache, "wb") as f:
+            pickle.dump((state, dbds), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except (IOError, OSError):
+        pass
     return dbds
 
 
@@ -132,11 +260,16 @@ class build_version (Grammar):
 
 
 class build_version_raw:
+    __slots__ = ("major", "minor", "patch", "build", "key")
+
     def __init__(self, major, minor, patch, build):
         self.major = major
         self.minor = minor
         self.patch = patch
         self.build = build
+        # comparisons happen a lot while sorting definitions, so keep the
+        # ordering tuple around instead of rebuilding it per comparison
+        self.key = (major, minor, patch, build)
 
     def __str__(self):
         return "{}.{}".format (self.version(), self.build)
@@ -144,29 +277,26 @@ class build_version_raw:
     def version(self):
         return "{}.{}.{}".format(self.major, self.minor, self.patch)
 
+    def __hash__(self):
+        return hash(self.key)
+
     def __lt__(self, rhs):
-        return (self.major, self.minor, self.patch, self.build) \
-                 < (rhs.major, rhs.minor, rhs.patch, rhs.build)
+        return self.key < rhs.key
 
     def __le__(self, rhs):
-        return (self.major, self.minor, self.patch, self.build) \
-               <= (rhs.major, rhs.minor, rhs.patch, rhs.build)
+        return self.key <= rhs.key
 
     def __eq__(self, rhs):
-        return (self.major, self.minor, self.patch, self.build) \
-               == (rhs.major, rhs.minor, rhs.patch, rhs.build)
+        return self.key == rhs.key
 
     def __ne__(self, rhs):
-        return (self.major, self.minor, self.patch, self.build) \
-               != (rhs.major, rhs.minor, rhs.patch, rhs.build)
+        return self.key != rhs.key
 
     def __gt__(self, rhs):
-        return (self.major, self.minor, self.patch, self.build) \
-               > (rhs.major, rhs.minor, rhs.patch, rhs.build)
+        return self.key > rhs.key
 
     def __ge__(self, rhs):
-        return (self.major, self.minor, self.patch, self.build) \
-               >= (rhs.major, rhs.minor, rhs.patch, rhs.build)
+        return self.key >= rhs.key
 
 
 class build_version_range(Grammar):
@@ -262,7 +392,6 @@ class definitions(Grammar):
                     yield item
 
         self.builds = list(chain.from_iterable(([builds.builds for builds in self.find_all("BUILD")])))
-        # self.builds = list(flatten([builds.builds for builds in self.find_all("BUILD")]))
         self.layouts = list(flatten([layouts.layouts for layouts in self.find_all("LAYOUT")]))
         self.comments = [stru(comment) for comment in self.find_all("COMMENT")]
         self.entries = [entry for entry in self.find_all("ENTRY")]
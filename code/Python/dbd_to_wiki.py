@@ -3,6 +3,8 @@
 
 import argparse
 import dbd
+import functools
+import multiprocessing
 import operator
 import os
 import sys
@@ -16,91 +18,98 @@ def merge_build_ranges(builds):
     cur = last = builds[0]
     for build in builds[1:]:
       if build - last != 1:
-        out += [((version, cur), (version, last) if cur != last else None)]
+        out.append(((version, cur), (version, last) if cur != last else None))
         cur = build
       last = build
-    out += [((version, cur), (version, last) if cur != last else None)]
+    out.append(((version, cur), (version, last) if cur != last else None))
 
   return out
 
-import argparse
-
-parser = argparse.ArgumentParser()
-parser.add_argument( '--definitions', dest="definitions", type=str, required=True
-                   , help="location of .dbd files")
-parser.add_argument( '--output', dest="output", type=str, required=True
-                   , help="directory to dump wiki pages to")
-parser.add_argument( '--only', dest="only", action='append'
-                   , help='if given, a list of tables to dump')
-args = parser.parse_args()
-
-if not os.path.isdir (args.output):
-  os.makedirs (args.output)
-
-dbds = {}
-if args.only:
-  for table in args.only:
-    dbds[table] = dbd.parse_dbd_file(os.path.join(args.definitions, "{}{}".format(table, dbd.file_suffix)))
-else:
-  dbds = dbd.parse_dbd_directory(args.definitions)
-
-file_data = {}
-
-for name, parsed in dbds.items():
-  file_data[name] = ""
-
-  columns = {}
-  for column in parsed.columns:
-    columns[column.name] = column
+wiki_format_templates = { "Type": ("{{{{Type|{}}}}}", "{}ⁱ")
+                        , "Unverified": ("{{{{Unverified|{}}}}}", "{}ᵘ")
+                        , "ForeignKey": ("{{{{Type/foreign_key|type={}|table={}|column={}}}}}", "foreign_keyⁱ<{}, &{}Rec::{}>")
+                        , "SectionBox": ("{{{{SectionBox|{}}}}}", "WRONG {} WRONG")
+                        , "PrettyVersion": ("{{{{Sandbox/PrettyVersion|{}}}}}", "WRONG {} WRONG")
+                        , "VersionRange": ("{{{{Sandbox/VersionRange|{}|{}}}}}", "WRONG {}|{} WRONG")
+                        }
+
+def wiki_format_template(templ, *args):
+  sf, lf = wiki_format_templates[templ]
+  s = sf.format(*args)
+  l = len(lf.format(*args))
+  return (s, l)
+
+def wiki_format_raw(fmt, *args):
+  s = fmt.format(*args)
+  return (s, len(s))
+
+int_types = frozenset(("uint", "int"))
+text_types = frozenset(("string", "locstring"))
+
+wiki_type_strs = {}
+
+def wiki_format_type(meta_type, foreign, int_width, is_unsigned):
+  key = (meta_type, foreign, int_width, is_unsigned)
+  cached = wiki_type_strs.get(key)
+  if cached is not None:
+    return cached
+  if meta_type in int_types:
+    type = wiki_format_raw("{}{}_t", meta_type if not is_unsigned else "uint", int_width if int_width else 32)
+    if foreign:
+      type = wiki_format_template("ForeignKey", type[0], foreign.table, "m_{}".format(foreign.column))
+  else:
+    assert (not int_width)
+    assert (not foreign)
+    if meta_type in text_types:
+      wikiname = "stringref" if meta_type == "string" else "langstringref"
+      type = wiki_format_template("Type", wikiname)
+    else:
+      type = wiki_format_raw("{}", meta_type)
+  wiki_type_strs[key] = type
+  return type
+
+wiki_name_strs = {}
+
+def wiki_format_name(column, is_confirmed_name):
+  key = (column, is_confirmed_name)
+  cached = wiki_name_strs.get(key)
+  if cached is None:
+    if is_confirmed_name:
+      cached = wiki_format_raw("m_{}".format(column))
+    else:
+      cached = wiki_format_template("Unverified", "m_{}".format(column))
+    wiki_name_strs[key] = cached
+  return cached
+
+def wiki_format_version(version, build, prefix = ''):
+  #! \todo will break with version 10.
+  return "{}expansionlevel={}|{}build={}.{}".format(prefix, version[0], prefix, version, build)
+
+def generate_page(item, verbose):
+  name, parsed = item
+  data = []
+
+  columns = {column.name: column for column in parsed.columns}
   assert(len(columns)==len(parsed.columns))
 
   for definition in sorted(parsed.definitions, key=operator.attrgetter('builds')):
-    def wiki_format_template(templ, *args):
-      templates = { "Type": ("{{{{Type|{}}}}}", "{}ⁱ")
-                  , "Unverified": ("{{{{Unverified|{}}}}}", "{}ᵘ")
-                  , "ForeignKey": ("{{{{Type/foreign_key|type={}|table={}|column={}}}}}", "foreign_keyⁱ<{}, &{}Rec::{}>")
-                  , "SectionBox": ("{{{{SectionBox|{}}}}}", "WRONG {} WRONG")
-                  , "PrettyVersion": ("{{{{Sandbox/PrettyVersion|{}}}}}", "WRONG {} WRONG")
-                  , "VersionRange": ("{{{{Sandbox/VersionRange|{}|{}}}}}", "WRONG {}|{} WRONG")
-                  }
-      sf, lf = templates[templ]
-      s = sf.format(*args)
-      l = len(lf.format(*args))
-      return (s, l)
-    def wiki_format_raw(fmt, *args):
-      s = fmt.format(*args)
-      return (s, len(s))
-
     lines = []
     for entry in definition.entries:
       meta = columns[entry.column]
+      meta_type = meta.type
+      foreign = meta.foreign
+      int_width = entry.int_width
 
       #! \todo annotations
 
-      def wiki_format_type():
-        print (meta.type, entry.column, name)
-        if meta.type in ["uint", "int"]:
-          type = wiki_format_raw("{}{}_t", meta.type if not entry.is_unsigned else "uint", entry.int_width if entry.int_width else 32)
-          if meta.foreign:
-            return wiki_format_template("ForeignKey", type[0], meta.foreign.table, "m_{}".format(meta.foreign.column))
-          return type
-        assert (not entry.int_width)
-        assert (not meta.foreign)
-
-        if meta.type in ["string", "locstring"]:
-          wikiname = "stringref" if meta.type == "string" else "langstringref"
-          return wiki_format_template("Type", wikiname)
-        else:
-          return wiki_format_raw("{}", meta.type)
-      type_str = wiki_format_type()
+      if verbose:
+        print (meta_type, entry.column, name)
+      type_str = wiki_format_type(meta_type, foreign, int_width, entry.is_unsigned)
 
       array_str_str = "[{}]".format(entry.array_size) if entry.array_size else ""
       array_str = (array_str_str, len(array_str_str))
 
-      if meta.is_confirmed_name:
-        name_str = wiki_format_raw("m_{}".format(entry.column))
-      else:
-        name_str = wiki_format_template("Unverified", "m_{}".format(entry.column))
+      name_str = wiki_format_name(entry.column, meta.is_confirmed_name)
 
       comments = []
 
@@ -108,18 +117,22 @@ for name, parsed in dbds.items():
       for annotation in entry.annotation:
         if annotation == "noninline":
           merged_str_pattern = "   // {} {}{};"
-          comments += ["non-inline field"]
+          comments.append("non-inline field")
         elif annotation == "id":
           pass
         else:
-          comments += ["{}".format(annotation)]
+          comments.append("{}".format(annotation))
       merged_str = merged_str_pattern.format(type_str[0], name_str[0], array_str[0])
       merged_str_visual_len = len(merged_str_pattern.format('t'*type_str[1], 'n'*name_str[1], 'a'*array_str[1]))
 
-      comments += [entry.comment] if entry.comment else []
-      comments += [meta.comment] if meta.comment else []
+      entry_comment = entry.comment
+      meta_comment = meta.comment
+      if entry_comment:
+        comments.append(entry_comment)
+      if meta_comment:
+        comments.append(meta_comment)
 
-      lines += [(merged_str, merged_str_visual_len, comments)]
+      lines.append((merged_str, merged_str_visual_len, comments))
 
     comment_indent = max(lines, key=operator.itemgetter(1))[1] + 2
 
@@ -128,21 +141,16 @@ for name, parsed in dbds.items():
     section_title_builds = []
     for begin, end in build_ranges:
       if not end:
-        section_title_builds += ["{}.{}".format(begin[0], begin[1])]
+        section_title_builds.append("{}.{}".format(begin[0], begin[1]))
         multiple_builds += 1
       else:
-        section_title_builds += ["{}.{}-{}.{}".format(begin[0], begin[1], end[0], end[1])]
+        section_title_builds.append("{}.{}-{}.{}".format(begin[0], begin[1], end[0], end[1]))
         multiple_builds += 2
-    build_ranges_str = ', '.join(section_title_builds)
-
-    layout_hashes = [str(layout) for layout in definition.layouts]
+    layout_hashes = definition.layouts
     #! \todo This is a really shit section title.
-    file_data[name] += "=={}==\n".format(", ".join(section_title_builds + layout_hashes))
+    data.append("=={}==\n".format(", ".join(section_title_builds + layout_hashes)))
 
     box_content = "This definition applies to "
-    def wiki_format_version(version, build, prefix = ''):
-      #! \todo will break with version 10.
-      return "{}expansionlevel={}|{}build={}.{}".format(prefix, version[0], prefix, version, build)
     if multiple_builds == 1:
       build = build_ranges[0][0]
       box_content += "version {}".format(wiki_format_template("PrettyVersion", wiki_format_version(build[0], build[1]))[0])
@@ -151,9 +159,9 @@ for name, parsed in dbds.items():
       strs = []
       for begin, end in build_ranges:
         if not end:
-          strs += [wiki_format_template("PrettyVersion", wiki_format_version(begin[0], begin[1]))[0]]
+          strs.append(wiki_format_template("PrettyVersion", wiki_format_version(begin[0], begin[1]))[0])
         else:
-          strs += [wiki_format_template("VersionRange", wiki_format_version(begin[0], begin[1], "min_"), wiki_format_version(end[0], end[1], "max_"))[0]]
+          strs.append(wiki_format_template("VersionRange", wiki_format_version(begin[0], begin[1], "min_"), wiki_format_version(end[0], end[1], "max_"))[0])
       box_content += "\n* ".join (strs)
     if layout_hashes:
       if multiple_builds:
@@ -163,21 +171,59 @@ for name, parsed in dbds.items():
         box_content += "layout hash <tt>{}</tt>".format(layout_hashes[0])
       elif len(layout_hashes) > 1:
         box_content += "layout hashes \n* <tt>{}</tt>".format("</tt>\n* <tt>".join(layout_hashes))
-    file_data[name] += wiki_format_template("SectionBox", box_content)[0] + "\n"
+    data.append(wiki_format_template("SectionBox", box_content)[0] + "\n")
 
-    for comment in definition.comments:
-      file_data[name] += str(comment) + "\n\n"
-    file_data[name] += " struct {}Rec {{\n".format(name)
+    data.append("".join("{}\n\n".format(comment) for comment in definition.comments))
+    data.append(" struct {}Rec {{\n".format(name))
+    indent = " " * comment_indent
     for line, linelen, comments in lines:
       if comments:
-        file_data[name] += "{}{} // {}\n".format(line, ' '*(comment_indent - linelen), comments[0])
+        data.append("{}{} // {}\n".format(line, indent[linelen:], comments[0]))
         for comment in comments[1:]:
-          file_data[name] += "{} // {}\n".format(" "*comment_indent, comment)
+          data.append("{} // {}\n".format(indent, comment))
       else:
-        file_data[name] += line + "\n"
-    file_data[name] += " };\n"
-
-for name, data in file_data.items():
-  print(name)
-  with open(os.path.join(args.output, "{}.mwiki".format(name)), "w") as f:
-    f.write(data)
+        data.append(line + "\n")
+    data.append(" };\n")
+
+  return name, "".join(data)
+
+
+def write_pages(results, output):
+  for name, page in results:
+    print(name)
+    with open(os.path.join(output, "{}.mwiki".format(name)), "w") as f:
+      f.write(page)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument( '--definitions', dest="definitions", type=str, required=True
+                     , help="location of .dbd files")
+  parser.add_argument( '--output', dest="output", type=str, required=True
+                     , help="directory to dump wiki pages to")
+  parser.add_argument( '--only', dest="only", action='append'
+                     , help='if given, a list of tables to dump')
+  parser.add_argument( '--verbose', dest="verbose", action='store_true'
+                     , help='print each column as it is processed')
+  args = parser.parse_args()
+
+  if not os.path.isdir (args.output):
+    os.makedirs (args.output)
+
+  dbds = {}
+  if args.only:
+    for table in args.only:
+      dbds[table] = dbd.parse_dbd_file(os.path.join(args.definitions, "{}{}".format(table, dbd.file_suffix)))
+  else:
+    dbds = dbd.parse_dbd_directory_cached(args.definitions)
+
+  page = functools.partial(generate_page, verbose=args.verbose)
+  if len(dbds) > 1:
+    with multiprocessing.Pool() as pool:
+      write_pages(pool.imap(page, dbds.items(), chunksize=4), args.output)
+  else:
+    write_pages(map(page, dbds.items()), args.output)
+
+
+if __name__ == "__main__":
+  main()